@@ -16,7 +16,22 @@ class Config:
     HUGGINGFACE_API_KEY = os.getenv("HUGGINGFACE_API_KEY")
     
     # Vector Database
+    # "chroma" (default) or "faiss" for corpora of millions of chunks
+    VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma").lower()
     CHROMA_PERSIST_DIRECTORY = os.getenv("CHROMA_PERSIST_DIRECTORY", "./chroma_db")
+    CHROMA_SERVER_MODE = os.getenv("CHROMA_SERVER_MODE", "False").lower() == "true"
+    CHROMA_HOST = os.getenv("CHROMA_HOST", "localhost")
+    # Not 8000, which vLLM (LLM_BASE_URL) listens on by default
+    CHROMA_PORT = int(os.getenv("CHROMA_PORT", "8001"))
+    CHROMA_ADD_BATCH_SIZE = 200
+    # HNSW index parameters (Chroma and FAISS): graph degree, build-time and
+    # query-time candidate list sizes. Chroma fixes them when a collection is
+    # created; FAISS applies HNSW_SEARCH_EF whenever an index is opened.
+    HNSW_M = 32
+    HNSW_CONSTRUCTION_EF = 200
+    HNSW_SEARCH_EF = int(os.getenv("HNSW_SEARCH_EF", "64"))
+    # Seconds a collection count is reused by get_collection_info
+    COLLECTION_COUNT_TTL = 2.0
     
     # Application Settings
     APP_NAME = os.getenv("APP_NAME", "RAG PDF Assistant")
@@ -24,19 +39,41 @@ class Config:
     
     # PDF Processing
     MAX_FILE_SIZE_MB = 50
+    IN_MEMORY_UPLOAD_LIMIT_MB = 8
+    # PDFs with at least this many pages are extracted across a process pool
+    PDF_PARALLEL_THRESHOLD = 32
     SUPPORTED_FORMATS = [".pdf", ".docx", ".txt"]
+    SUPPORTED_FORMAT_SET = frozenset(SUPPORTED_FORMATS)
+    # Directories never descended into when processing a directory tree
+    IGNORED_DIRECTORIES = frozenset({".git", "node_modules", ".venv", "venv", "__pycache__"})
     
-    # Chunking Settings
-    CHUNK_SIZE = 1000
-    CHUNK_OVERLAP = 200
+    # Chunking Settings (measured in tokens)
+    CHUNK_SIZE = 256
+    CHUNK_OVERLAP = 50
     
     # LLM Settings
+    # Optional OpenAI-compatible endpoint (e.g. a vLLM server run with --enable-prefix-caching)
+    LLM_BASE_URL = os.getenv("LLM_BASE_URL")
     DEFAULT_MODEL = "gpt-3.5-turbo"
-    EMBEDDING_MODEL = "text-embedding-ada-002"
+    EMBEDDING_MODEL = "text-embedding-3-small"
+    # Truncated server-side; each model and size is stored in its own collection
+    EMBEDDING_DIM = 512
+    EMBEDDING_BATCH_SIZE = 500
+    # Embedding requests in flight at once; keep within the account's rate limit
+    EMBEDDING_CONCURRENCY = 8
     TEMPERATURE = 0.7
     MAX_TOKENS = 1000
+    HISTORY_TOKEN_BUDGET = 1024
     
     # RAG Settings
     TOP_K_RESULTS = 5
-    SIMILARITY_THRESHOLD = 0.7
+    # Minimum cosine similarity for a retrieved chunk. text-embedding-3 scores
+    # relevant passages around 0.3-0.6 (ada-002 sat at 0.7-0.9), so 0.7 would
+    # drop nearly everything; tune per corpus via the environment
+    SIMILARITY_THRESHOLD = float(os.getenv("SIMILARITY_THRESHOLD", "0.3"))
+    
+    # Query Cache Settings
+    SEMANTIC_CACHE_SIZE = 2000
+    SEMANTIC_CACHE_THRESHOLD = 0.92
+    QUERY_EMBEDDING_CACHE_SIZE = 4096
 
@@ -8,7 +8,7 @@ import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from src.document_processor import DocumentProcessor
-from src.vector_store import VectorStore
+from src.vector_store import create_vector_store
 from src.rag_system import RAGSystem
 
 def sample_usage():
@@ -17,7 +17,7 @@ def sample_usage():
     # Initialize components
     print("Initializing RAG system...")
     document_processor = DocumentProcessor()
-    vector_store = VectorStore()
+    vector_store = create_vector_store()
     rag_system = RAGSystem(vector_store)
     
     # Sample questions
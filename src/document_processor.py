@@ -1,64 +1,311 @@
 """
 Document processing module for handling PDF and other document types
 """
+from __future__ import annotations
+
 import os
+import io
+import mmap
+import codecs
+import hashlib
 import logging
-from typing import List, Dict, Any
+import tempfile
+from functools import partial, lru_cache
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any, Iterable, Iterator, Collection, TYPE_CHECKING
 from pathlib import Path
-import PyPDF2
-import fitz  # PyMuPDF
-from docx import Document
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.schema import Document as LangchainDocument
 from config import Config
 
-logging.basicConfig(level=logging.INFO)
+# PyMuPDF, python-docx, tiktoken and LangChain are imported where they are
+# used so importing this module (e.g. at Streamlit startup) stays cheap
+if TYPE_CHECKING:
+    from langchain.schema import Document as LangchainDocument
+
 logger = logging.getLogger(__name__)
 
+# Files larger than this are hashed through mmap to avoid a userspace copy,
+# and text files larger than this are decoded in blocks
+LARGE_FILE_THRESHOLD = 64 * 1024 * 1024
+
+_pdf_executor = None
+
+# Cleared in directory-ingest workers, which already run one file per core
+_page_parallelism = True
+
+
+def _get_pdf_executor() -> ProcessPoolExecutor:
+    """Return the shared process pool used for PDF page extraction"""
+    global _pdf_executor
+    if _pdf_executor is None:
+        _pdf_executor = ProcessPoolExecutor()
+    return _pdf_executor
+
+
+def _init_directory_worker():
+    """Keep directory workers from spawning nested page-extraction pools"""
+    global _page_parallelism
+    _page_parallelism = False
+
+
+def _content_hash(text: str) -> str:
+    """Fast non-cryptographic fingerprint of chunk text, used as the embedding cache key"""
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def _new_file_hasher():
+    """Hasher shared by the file and in-memory fingerprints"""
+    return hashlib.blake2b(digest_size=16)
+
+
+def _file_hash(file_path: str) -> str:
+    """Fingerprint a file's bytes for ingest deduplication"""
+    with open(file_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size > LARGE_FILE_THRESHOLD:
+            hasher = _new_file_hasher()
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                hasher.update(mm)
+            return hasher.hexdigest()
+        if hasattr(hashlib, 'file_digest'):  # Python 3.11+
+            return hashlib.file_digest(f, _new_file_hasher).hexdigest()
+        hasher = _new_file_hasher()
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            hasher.update(block)
+        return hasher.hexdigest()
+
+
+def _bytes_hash(data: bytes) -> str:
+    """Fingerprint in-memory file contents, matching _file_hash"""
+    hasher = _new_file_hasher()
+    hasher.update(data)
+    return hasher.hexdigest()
+
+
+class _TokenChunker:
+    """Split-then-merge chunker that measures chunk length in tokens
+    
+    Text is first split recursively on progressively finer separators until
+    every segment is under chunk_size tokens, then adjacent segments are
+    greedily merged back up to chunk_size. Chunks below MIN_CHUNK_TOKENS are
+    merged with their neighbour and chunks over 1.05 x chunk_size are re-split.
+    """
+    
+    SEPARATORS = ["\n\n", "\n", ". ", " "]
+    MIN_CHUNK_TOKENS = 100
+    OVERSIZE_FACTOR = 1.05
+    
+    def __init__(self, chunk_size: int, chunk_overlap: int):
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        import tiktoken
+        try:
+            self.encoding = tiktoken.encoding_for_model(Config.EMBEDDING_MODEL)
+        except KeyError:
+            # Older tiktoken releases do not know the text-embedding-3 models
+            self.encoding = tiktoken.get_encoding("cl100k_base")
+    
+    def _encode(self, text: str) -> List[int]:
+        return self.encoding.encode(text, disallowed_special=())
+    
+    def _split(self, text: str, separators: List[str]) -> List[str]:
+        """Pass 1: recursively split text until each segment fits chunk_size"""
+        if len(self._encode(text)) < self.chunk_size:
+            return [text]
+        
+        if not separators:
+            # No separator left to split on; cut on token boundaries
+            tokens = self._encode(text)
+            return [self.encoding.decode(tokens[i:i + self.chunk_size])
+                    for i in range(0, len(tokens), self.chunk_size)]
+        
+        separator, finer = separators[0], separators[1:]
+        parts = text.split(separator)
+        if len(parts) == 1:
+            return self._split(text, finer)
+        
+        segments = []
+        for i, part in enumerate(parts):
+            # Keep separators attached so merged chunks read like the source
+            if i < len(parts) - 1:
+                part += separator
+            if part:
+                segments.extend(self._split(part, finer))
+        return segments
+    
+    def _merge(self, segments: List[str]) -> List[List[int]]:
+        """Pass 2: greedily merge adjacent segments up to chunk_size tokens"""
+        merged = []
+        current = []
+        for segment in segments:
+            tokens = self._encode(segment)
+            if (current and len(current) + len(tokens) > self.chunk_size
+                    and len(current) >= self.MIN_CHUNK_TOKENS):
+                merged.append(current)
+                current = []
+            current = current + tokens
+        if current:
+            # A tiny trailing chunk folds into its predecessor when it fits
+            limit = self.OVERSIZE_FACTOR * self.chunk_size
+            if (merged and len(current) < self.MIN_CHUNK_TOKENS
+                    and len(merged[-1]) + len(current) <= limit):
+                merged[-1] = merged[-1] + current
+            else:
+                merged.append(current)
+        return merged
+    
+    def _resplit(self, chunks: List[List[int]]) -> List[List[int]]:
+        """Evenly re-split chunks that overshoot chunk_size by more than 5%"""
+        result = []
+        limit = self.OVERSIZE_FACTOR * self.chunk_size
+        for tokens in chunks:
+            if len(tokens) <= limit:
+                result.append(tokens)
+                continue
+            parts = -(-len(tokens) // self.chunk_size)
+            step = -(-len(tokens) // parts)
+            result.extend(tokens[i:i + step] for i in range(0, len(tokens), step))
+        return result
+    
+    def split_text(self, text: str) -> List[str]:
+        """Split text into overlapping chunks of roughly chunk_size tokens"""
+        chunks = self._resplit(self._merge(self._split(text, self.SEPARATORS)))
+        
+        texts = []
+        previous = None
+        for tokens in chunks:
+            # Prepend the tail of the previous chunk to preserve overlap
+            if previous is not None and self.chunk_overlap:
+                tokens = previous[-self.chunk_overlap:] + tokens
+            previous = tokens
+            chunk_text = self.encoding.decode(tokens).strip()
+            if chunk_text:
+                texts.append(chunk_text)
+        return texts
+
+
+@lru_cache(maxsize=8)
+def _make_splitter(chunk_size: int, chunk_overlap: int) -> _TokenChunker:
+    """Build a chunker once per settings pair in each process"""
+    return _TokenChunker(chunk_size, chunk_overlap)
+
+
+def _iter_document_entries(root: str) -> Iterator[os.DirEntry]:
+    """Walk a directory tree yielding supported files, pruning ignored directories
+    
+    Directories and entries that cannot be read are logged and skipped.
+    """
+    try:
+        with os.scandir(root) as entries:
+            subdirectories = []
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if entry.name not in Config.IGNORED_DIRECTORIES:
+                            subdirectories.append(entry.path)
+                    elif (entry.is_file()
+                          and os.path.splitext(entry.name)[1].lower() in Config.SUPPORTED_FORMAT_SET):
+                        yield entry
+                except OSError as e:
+                    logger.error(f"Error reading {entry.path}: {e}")
+    except OSError as e:
+        logger.error(f"Error reading directory {root}: {e}")
+        return
+    
+    for subdirectory in subdirectories:
+        yield from _iter_document_entries(subdirectory)
+
+
+def _entry_size(entry: os.DirEntry) -> int:
+    """File size for scheduling; 0 if the file cannot be stat'ed"""
+    try:
+        return entry.stat().st_size
+    except OSError:
+        return 0
+
+
+@lru_cache(maxsize=None)
+def _text_flags() -> int:
+    """PyMuPDF extraction flags, resolved once per process
+    
+    The plain-text defaults (ligatures, whitespace, mediabox clipping) plus
+    dehyphenation so words broken across lines are rejoined before chunking.
+    """
+    import fitz  # PyMuPDF
+    return fitz.TEXTFLAGS_TEXT | fitz.TEXT_DEHYPHENATE
+
+
+def _page_text(page) -> str:
+    """Extract plain text from a single PyMuPDF page, skipping pages that fail"""
+    try:
+        return page.get_text("text", flags=_text_flags())
+    except Exception as e:
+        logger.error(f"Error extracting text from page {page.number}: {e}")
+        return ""
+
+
+def _extract_page_range(file_path: str, start: int, end: int) -> str:
+    """Extract text from pages [start, end) of a PDF, opening its own handle"""
+    import fitz  # PyMuPDF
+    doc = fitz.open(file_path)
+    try:
+        return "\n".join(_page_text(doc[i]) for i in range(start, end))
+    finally:
+        doc.close()
+
+
 class DocumentProcessor:
     """Handles document loading, parsing, and chunking"""
     
     def __init__(self):
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=Config.CHUNK_SIZE,
-            chunk_overlap=Config.CHUNK_OVERLAP,
-            length_function=len,
-        )
+        self.chunk_size = Config.CHUNK_SIZE
+        self.chunk_overlap = Config.CHUNK_OVERLAP
+    
+    @property
+    def text_splitter(self) -> _TokenChunker:
+        """Shared text splitter for this processor's chunk settings"""
+        return _make_splitter(self.chunk_size, self.chunk_overlap)
     
-    def load_pdf_pypdf2(self, file_path: str) -> str:
-        """Load PDF using PyPDF2"""
+    def iter_pdf_pages(self, file_path: str) -> Iterator[str]:
+        """Yield PDF text page by page, or shard by shard for large PDFs"""
+        import fitz  # PyMuPDF
         try:
-            with open(file_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                text = ""
-                for page in pdf_reader.pages:
-                    text += page.extract_text() + "\n"
-                return text
+            doc = fitz.open(file_path)
         except Exception as e:
-            logger.error(f"Error loading PDF with PyPDF2: {e}")
-            return ""
+            logger.error(f"Error loading PDF with PyMuPDF: {e}")
+            return
+        
+        try:
+            # Short PDFs reuse the open handle serially; process-pool start-up
+            # and per-shard re-opening only pay off on long documents
+            page_count = doc.page_count
+            if not _page_parallelism or page_count < Config.PDF_PARALLEL_THRESHOLD:
+                for page in doc:
+                    yield _page_text(page)
+                return
+        finally:
+            doc.close()
+        
+        # Split the page range into one contiguous shard per core
+        workers = os.cpu_count() or 1
+        step = -(-page_count // workers)
+        starts = list(range(0, page_count, step))
+        ends = [min(start + step, page_count) for start in starts]
+        
+        executor = _get_pdf_executor()
+        yield from executor.map(_extract_page_range, [file_path] * len(starts), starts, ends)
     
     def load_pdf_pymupdf(self, file_path: str) -> str:
-        """Load PDF using PyMuPDF (fitz) - better for complex PDFs"""
+        """Load PDF using PyMuPDF (fitz), sharding large PDFs across processes"""
         try:
-            doc = fitz.open(file_path)
-            text = ""
-            for page in doc:
-                text += page.get_text() + "\n"
-            doc.close()
-            return text
+            return "\n".join(self.iter_pdf_pages(file_path))
         except Exception as e:
-            logger.error(f"Error loading PDF with PyMuPDF: {e}")
+            logger.error(f"Error extracting PDF text: {e}")
             return ""
     
     def load_docx(self, file_path: str) -> str:
         """Load DOCX file"""
+        from docx import Document
         try:
-            doc = Document(file_path)
-            text = ""
-            for paragraph in doc.paragraphs:
-                text += paragraph.text + "\n"
-            return text
+            return "\n".join(p.text for p in Document(file_path).paragraphs)
         except Exception as e:
             logger.error(f"Error loading DOCX: {e}")
             return ""
@@ -66,8 +313,17 @@ class DocumentProcessor:
     def load_txt(self, file_path: str) -> str:
         """Load text file"""
         try:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                return file.read()
+            with open(file_path, 'rb') as file:
+                size = os.fstat(file.fileno()).st_size
+                if size == 0:
+                    return ""
+                if size > LARGE_FILE_THRESHOLD:
+                    # Decode in blocks so the raw bytes are never held in full
+                    reader = codecs.getreader('utf-8')(file, errors='replace')
+                    return "".join(iter(lambda: reader.read(1024 * 1024), ""))
+                # Decode straight from the mapped pages, skipping the read() copy
+                with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    return str(mm, 'utf-8', 'replace')
         except Exception as e:
             logger.error(f"Error loading TXT: {e}")
             return ""
@@ -78,11 +334,7 @@ class DocumentProcessor:
         extension = file_path.suffix.lower()
         
         if extension == '.pdf':
-            # Try PyMuPDF first, fallback to PyPDF2
-            text = self.load_pdf_pymupdf(str(file_path))
-            if not text.strip():
-                text = self.load_pdf_pypdf2(str(file_path))
-            return text
+            return self.load_pdf_pymupdf(str(file_path))
         elif extension == '.docx':
             return self.load_docx(str(file_path))
         elif extension == '.txt':
@@ -91,6 +343,27 @@ class DocumentProcessor:
             logger.warning(f"Unsupported file format: {extension}")
             return ""
     
+    def load_bytes(self, name: str, data: bytes) -> str:
+        """Load an in-memory document based on the extension of its name"""
+        extension = Path(name).suffix.lower()
+        
+        try:
+            if extension == '.pdf':
+                import fitz  # PyMuPDF
+                with fitz.open(stream=data, filetype="pdf") as doc:
+                    return "\n".join(_page_text(page) for page in doc)
+            elif extension == '.docx':
+                from docx import Document
+                return "\n".join(p.text for p in Document(io.BytesIO(data)).paragraphs)
+            elif extension == '.txt':
+                return bytes(data).decode('utf-8', errors='replace')
+            else:
+                logger.warning(f"Unsupported file format: {extension}")
+                return ""
+        except Exception as e:
+            logger.error(f"Error loading {name} from memory: {e}")
+            return ""
+    
     def chunk_document(self, text: str, metadata: Dict[str, Any] = None) -> List[LangchainDocument]:
         """Split document into chunks"""
         if not text.strip():
@@ -100,28 +373,75 @@ class DocumentProcessor:
         if metadata is None:
             metadata = {}
         
-        # Create langchain document
-        doc = LangchainDocument(page_content=text, metadata=metadata)
-        
-        # Split into chunks
-        chunks = self.text_splitter.split_documents([doc])
-        
-        # Add chunk index to metadata
-        for i, chunk in enumerate(chunks):
-            chunk.metadata['chunk_index'] = i
+        # Split into chunks carrying their index and content hash
+        chunks = [
+            self._make_chunk(piece, metadata, i)
+            for i, piece in enumerate(self.text_splitter.split_text(text))
+        ]
         
         logger.info(f"Created {len(chunks)} chunks from document")
         return chunks
     
-    def process_document(self, file_path: str) -> List[LangchainDocument]:
-        """Complete document processing pipeline"""
-        logger.info(f"Processing document: {file_path}")
+    def chunk_pages(self, pages: Iterable[str], metadata: Dict[str, Any] = None) -> Iterator[LangchainDocument]:
+        """Split a stream of page texts into chunks without joining the whole document
         
-        # Load document
-        text = self.load_document(file_path)
-        if not text.strip():
-            logger.warning(f"No text extracted from {file_path}")
-            return []
+        Only the current page plus the unfinished tail chunk are held in memory;
+        the tail is carried into the next split so chunks still span page breaks.
+        """
+        if metadata is None:
+            metadata = {}
+        
+        index = 0
+        buffer = ""
+        for page_text in pages:
+            buffer = f"{buffer}\n{page_text}" if buffer else page_text
+            # chunk_size is in tokens; wait for roughly two chunks' worth of text
+            if len(buffer) < 8 * self.chunk_size:
+                continue
+            
+            pieces = self.text_splitter.split_text(buffer)
+            if not pieces:
+                buffer = ""
+                continue
+            for piece in pieces[:-1]:
+                yield self._make_chunk(piece, metadata, index)
+                index += 1
+            buffer = pieces[-1]
+        
+        if buffer.strip():
+            for piece in self.text_splitter.split_text(buffer):
+                yield self._make_chunk(piece, metadata, index)
+                index += 1
+        
+        logger.info(f"Created {index} chunks from document")
+    
+    def _make_chunk(self, text: str, metadata: Dict[str, Any], index: int) -> LangchainDocument:
+        """Build a chunk document carrying its index and content hash"""
+        from langchain.schema import Document as LangchainDocument
+        return LangchainDocument(
+            page_content=text,
+            metadata={**metadata, 'chunk_index': index, 'content_hash': _content_hash(text)}
+        )
+    
+    def iter_document_chunks(self, file_path: str,
+                             skip_hashes: Collection[str] = ()) -> Iterator[LangchainDocument]:
+        """Streaming document processing pipeline
+        
+        Files whose content hash is in skip_hashes were already ingested and
+        yield nothing without being parsed.
+        """
+        try:
+            file_hash = _file_hash(file_path)
+            file_size = Path(file_path).stat().st_size
+        except OSError as e:
+            logger.error(f"Error reading document {file_path}: {e}")
+            return
+        
+        if file_hash in skip_hashes:
+            logger.info(f"Skipping already ingested document: {file_path}")
+            return
+        
+        logger.info(f"Processing document: {file_path}")
         
         # Create metadata
         file_path = Path(file_path)
@@ -129,22 +449,103 @@ class DocumentProcessor:
             'source': str(file_path),
             'filename': file_path.name,
             'file_type': file_path.suffix,
-            'file_size': file_path.stat().st_size
+            'file_size': file_size,
+            'file_hash': file_hash
         }
         
-        # Chunk document
-        chunks = self.chunk_document(text, metadata)
+        produced = False
+        for chunk in self._iter_file_chunks(str(file_path), metadata):
+            produced = True
+            yield chunk
         
-        return chunks
+        if not produced:
+            logger.warning(f"No text extracted from {file_path}")
+    
+    def _iter_file_chunks(self, file_path: str, metadata: Dict[str, Any]) -> Iterator[LangchainDocument]:
+        """Chunks of a file on disk; PDFs are streamed page by page, other formats load in one piece"""
+        if Path(file_path).suffix.lower() == '.pdf':
+            pages = self.iter_pdf_pages(file_path)
+        else:
+            pages = [self.load_document(file_path)]
+        return self.chunk_pages(pages, metadata)
+    
+    def process_document(self, file_path: str,
+                         skip_hashes: Collection[str] = ()) -> List[LangchainDocument]:
+        """Complete document processing pipeline"""
+        return list(self.iter_document_chunks(file_path, skip_hashes))
+    
+    def process_bytes(self, name: str, data: bytes,
+                      skip_hashes: Collection[str] = ()) -> List[LangchainDocument]:
+        """Processing pipeline for an uploaded document held in memory"""
+        return list(self.iter_bytes_chunks(name, data, skip_hashes))
     
-    def process_directory(self, directory_path: str) -> List[LangchainDocument]:
+    def iter_bytes_chunks(self, name: str, data: bytes,
+                          skip_hashes: Collection[str] = ()) -> Iterator[LangchainDocument]:
+        """Streaming processing pipeline for an uploaded document held in memory
+        
+        Large uploads are spooled to a temp file and streamed page by page
+        like files on disk, so their text is never held whole.
+        """
+        file_hash = _bytes_hash(data)
+        if file_hash in skip_hashes:
+            logger.info(f"Skipping already ingested document: {name}")
+            return
+        
+        logger.info(f"Processing uploaded document: {name}")
+        
+        metadata = {
+            'source': name,
+            'filename': Path(name).name,
+            'file_type': Path(name).suffix,
+            'file_size': len(data),
+            'file_hash': file_hash
+        }
+        
+        produced = False
+        if len(data) > Config.IN_MEMORY_UPLOAD_LIMIT_MB * 1024 * 1024:
+            # Very large uploads go through a single temp file so the
+            # path-based streaming loaders (and parallel page extraction) apply
+            with tempfile.NamedTemporaryFile(suffix=Path(name).suffix, delete=False) as tmp:
+                tmp.write(data)
+            try:
+                for chunk in self._iter_file_chunks(tmp.name, metadata):
+                    produced = True
+                    yield chunk
+            finally:
+                os.remove(tmp.name)
+        else:
+            text = self.load_bytes(name, data)
+            if text.strip():
+                for chunk in self.chunk_document(text, metadata):
+                    produced = True
+                    yield chunk
+        
+        if not produced:
+            logger.warning(f"No text extracted from {name}")
+    
+    def process_directory(self, directory_path: str,
+                          skip_hashes: Collection[str] = ()) -> List[LangchainDocument]:
         """Process all supported documents in a directory"""
         directory_path = Path(directory_path)
         all_chunks = []
         
-        for file_path in directory_path.rglob("*"):
-            if file_path.is_file() and file_path.suffix.lower() in Config.SUPPORTED_FORMATS:
-                chunks = self.process_document(str(file_path))
+        # Largest files first so the slowest documents start earliest
+        entries = sorted(
+            _iter_document_entries(str(directory_path)),
+            key=_entry_size,
+            reverse=True,
+        )
+        
+        process = partial(self.process_document, skip_hashes=frozenset(skip_hashes))
+        seen_hashes = set()
+        with ProcessPoolExecutor(initializer=_init_directory_worker) as executor:
+            for chunks in executor.map(process, [entry.path for entry in entries]):
+                # Identical files in the tree are only ingested once
+                if chunks:
+                    file_hash = chunks[0].metadata['file_hash']
+                    if file_hash in seen_hashes:
+                        continue
+                    seen_hashes.add(file_hash)
                 all_chunks.extend(chunks)
         
         logger.info(f"Processed {len(all_chunks)} total chunks from directory")
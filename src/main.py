@@ -2,19 +2,37 @@
 Main application for the RAG PDF Assistant
 """
 import os
+import time
 import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Tuple
 import streamlit as st
 from document_processor import DocumentProcessor
-from vector_store import VectorStore
+from vector_store import create_vector_store
 from rag_system import RAGSystem
 from config import Config
 
-# Configure logging
+# Configure logging for the app; library modules only create loggers
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+class IngestJob:
+    """Handle for a background ingest; progress is updated by the worker thread"""
+    
+    def __init__(self, total: int):
+        self.total = total
+        self.completed = 0
+        self.future: Future = None
+    
+    def advance(self, count: int = 1):
+        self.completed += count
+    
+    @property
+    def progress(self) -> float:
+        return self.completed / self.total if self.total else 1.0
+
 class RAGApplication:
     """Main application class"""
     
@@ -22,6 +40,7 @@ class RAGApplication:
         self.document_processor = DocumentProcessor()
         self.vector_store = None
         self.rag_system = None
+        self.executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="ingest")
         self.initialize_components()
     
     def initialize_components(self):
@@ -33,7 +52,7 @@ class RAGApplication:
                 st.stop()
             
             # Initialize vector store
-            self.vector_store = VectorStore()
+            self.vector_store = create_vector_store()
             
             # Initialize RAG system
             self.rag_system = RAGSystem(self.vector_store)
@@ -43,43 +62,56 @@ class RAGApplication:
             st.error(f"Error initializing components: {e}")
             st.stop()
     
-    def upload_and_process_documents(self, uploaded_files) -> bool:
-        """Process uploaded documents"""
+    def upload_and_process_documents(self, uploaded_files) -> IngestJob:
+        """Start processing uploaded documents in the background
+        
+        Returns a job handle the UI can poll; its future resolves to a
+        (level, message) pair naming the st.* call used to report the result.
+        """
+        # Read the uploads on the script thread; the worker only sees bytes
+        files = [(uploaded_file.name, uploaded_file.getvalue()) for uploaded_file in uploaded_files]
+        job = IngestJob(len(files))
+        job.future = self.executor.submit(self._ingest, files, job)
+        return job
+    
+    def _ingest(self, files: List[Tuple[str, bytes]], job: IngestJob) -> Tuple[str, str]:
+        """Parse, chunk, embed and store uploaded files; runs on the ingest executor"""
         try:
-            if not uploaded_files:
-                return False
+            ingested = self.vector_store.ingested_file_hashes()
+            # Chunks produced so far and stored so far; a file counts as done
+            # once everything up to its last chunk has been stored
+            counts = {"produced": 0, "stored": 0}
+            file_ends = deque()
             
-            all_chunks = []
+            def on_stored(count: int):
+                counts["stored"] += count
+                while file_ends and file_ends[0] <= counts["stored"]:
+                    file_ends.popleft()
+                    job.advance()
             
-            for uploaded_file in uploaded_files:
-                # Save uploaded file temporarily
-                temp_path = f"temp_{uploaded_file.name}"
-                with open(temp_path, "wb") as f:
-                    f.write(uploaded_file.getbuffer())
-                
-                # Process document
-                chunks = self.document_processor.process_document(temp_path)
-                all_chunks.extend(chunks)
-                
-                # Clean up temp file
-                os.remove(temp_path)
+            def chunks():
+                for name, data in files:
+                    # Process document straight from the upload buffer
+                    for chunk in self.document_processor.iter_bytes_chunks(name, data, skip_hashes=ingested):
+                        # Skip identical files later in the same upload
+                        ingested.add(chunk.metadata["file_hash"])
+                        counts["produced"] += 1
+                        yield chunk
+                    file_ends.append(counts["produced"])
+                    on_stored(0)
             
-            # Add to vector store
-            if all_chunks:
-                success = self.vector_store.add_documents(all_chunks)
-                if success:
-                    st.success(f"Successfully processed {len(uploaded_files)} documents with {len(all_chunks)} chunks")
-                    return True
-                else:
-                    st.error("Failed to add documents to vector store")
-                    return False
+            # Chunks stream from parsing straight into the store
+            success = self.vector_store.add_documents(chunks(), on_progress=on_stored)
+            if not counts["produced"]:
+                return "warning", "No new content extracted from uploaded documents"
+            if success:
+                return "success", f"Successfully processed {len(files)} documents with {counts['produced']} chunks"
             else:
-                st.warning("No content extracted from uploaded documents")
-                return False
+                return "error", "Failed to add documents to vector store"
                 
         except Exception as e:
-            st.error(f"Error processing documents: {e}")
-            return False
+            logger.error(f"Error processing documents: {e}")
+            return "error", f"Error processing documents: {e}"
     
     def process_directory(self, directory_path: str) -> bool:
         """Process all documents in a directory"""
@@ -88,7 +120,10 @@ class RAGApplication:
                 st.error(f"Directory not found: {directory_path}")
                 return False
             
-            chunks = self.document_processor.process_directory(directory_path)
+            chunks = self.document_processor.process_directory(
+                directory_path,
+                skip_hashes=self.vector_store.ingested_file_hashes()
+            )
             
             if chunks:
                 success = self.vector_store.add_documents(chunks)
@@ -99,13 +134,18 @@ class RAGApplication:
                     st.error("Failed to add documents to vector store")
                     return False
             else:
-                st.warning("No documents found in directory")
+                st.warning("No new documents found in directory")
                 return False
                 
         except Exception as e:
             st.error(f"Error processing directory: {e}")
             return False
 
+@st.cache_resource
+def get_rag_app() -> RAGApplication:
+    """Build the application components once per process and share them across sessions"""
+    return RAGApplication()
+
 def main():
     """Main Streamlit application"""
     st.set_page_config(
@@ -117,13 +157,11 @@ def main():
     st.title("📚 RAG PDF Assistant")
     st.markdown("Upload PDF documents and ask questions about their content!")
     
-    # Initialize application
-    if 'rag_app' not in st.session_state:
-        st.session_state.rag_app = RAGApplication()
+    # Initialize application (shared across sessions); chat state stays per user
+    rag_app = get_rag_app()
+    if 'chat_history' not in st.session_state:
         st.session_state.chat_history = []
     
-    rag_app = st.session_state.rag_app
-    
     # Sidebar for document upload
     with st.sidebar:
         st.header("📄 Document Management")
@@ -136,15 +174,24 @@ def main():
             help="Upload one or more PDF, DOCX, or TXT files"
         )
         
+        if "jobs" not in st.session_state:
+            st.session_state.jobs = []
+        
         if st.button("Process Documents", type="primary"):
             if uploaded_files:
-                with st.spinner("Processing documents..."):
-                    success = rag_app.upload_and_process_documents(uploaded_files)
-                    if success:
-                        st.rerun()
+                st.session_state.jobs.append(rag_app.upload_and_process_documents(uploaded_files))
             else:
                 st.warning("Please upload some documents first")
         
+        # Report background ingest jobs; finished ones are shown once and dropped
+        for job in list(st.session_state.jobs):
+            if job.future.done():
+                level, message = job.future.result()
+                getattr(st, level)(message)
+                st.session_state.jobs.remove(job)
+            else:
+                st.progress(job.progress, text=f"Processing documents... {job.completed}/{job.total}")
+        
         # Directory processing
         st.subheader("Or process a directory")
         directory_path = st.text_input("Directory path:", placeholder="/path/to/documents")
@@ -195,23 +242,24 @@ def main():
             # Get response
             with st.chat_message("assistant"):
                 with st.spinner("Thinking..."):
-                    response = rag_app.rag_system.chat_with_context(
+                    response = rag_app.rag_system.chat_with_context_stream(
                         prompt, 
                         st.session_state.chat_history
                     )
-                    
-                    st.markdown(response["answer"])
-                    
-                    # Show sources if available
-                    if response["sources"]:
-                        with st.expander("📚 Sources"):
-                            for source in response["sources"]:
-                                st.write(f"• {source}")
+                
+                # Render tokens as they arrive
+                answer = st.write_stream(response["answer_stream"])
+                
+                # Show sources if available
+                if response["sources"]:
+                    with st.expander("📚 Sources"):
+                        for source in response["sources"]:
+                            st.write(f"• {source}")
             
             # Add assistant message
-            st.session_state.messages.append({"role": "assistant", "content": response["answer"]})
+            st.session_state.messages.append({"role": "assistant", "content": answer})
             st.session_state.chat_history.append({"role": "user", "content": prompt})
-            st.session_state.chat_history.append({"role": "assistant", "content": response["answer"]})
+            st.session_state.chat_history.append({"role": "assistant", "content": answer})
     
     with col2:
         st.header("🔍 Document Search")
@@ -255,6 +303,11 @@ def main():
             st.write("Try asking:")
             for q in sample_questions:
                 st.write(f"• {q}")
+    
+    # Poll while background ingests are running
+    if st.session_state.jobs:
+        time.sleep(1)
+        st.rerun()
 
 if __name__ == "__main__":
     main()
@@ -2,7 +2,8 @@
 RAG (Retrieval-Augmented Generation) system implementation
 """
 import logging
-from typing import List, Dict, Any, Optional
+from functools import lru_cache
+from typing import List, Dict, Any, Optional, Iterator, Tuple
 from langchain.llms import OpenAI
 from langchain.chat_models import ChatOpenAI
 from langchain.schema import Document as LangchainDocument
@@ -11,25 +12,66 @@ from langchain.chains import RetrievalQA
 from langchain.chains.question_answering import load_qa_chain
 from config import Config
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+
+@lru_cache(maxsize=None)
+def _get_encoding(model: str):
+    """tiktoken encoder for a model, built once per process"""
+    import tiktoken
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        # Models served from a custom endpoint may be unknown to tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+
+
+class _EmptyRetrieval(Exception):
+    """A retrieval found nothing; never stored in the retrieval cache"""
+
+
+def _unique_documents(docs: List[LangchainDocument]) -> List[LangchainDocument]:
+    """Drop repeated chunks (same content hash), keeping the first occurrence"""
+    seen = set()
+    unique = []
+    for doc in docs:
+        key = doc.metadata.get("content_hash") or hash(doc.page_content)
+        if key not in seen:
+            seen.add(key)
+            unique.append(doc)
+    return unique
+
+
+def _order_documents(docs: List[LangchainDocument]) -> List[LangchainDocument]:
+    """Sort retrieved documents deterministically so identical retrievals
+    produce a byte-identical prompt prefix that server-side prompt caches can reuse"""
+    return sorted(docs, key=lambda doc: (doc.metadata.get("source", ""), doc.metadata.get("chunk_index", 0)))
+
+
 class RAGSystem:
     """Main RAG system for question answering"""
     
     def __init__(self, vector_store):
         self.vector_store = vector_store
+        self._retrieve_cached = lru_cache(maxsize=512)(self._retrieve_uncached)
         self.llm = self._initialize_llm()
         self.qa_chain = self._initialize_qa_chain()
     
     def _initialize_llm(self):
         """Initialize the language model"""
         try:
+            llm_kwargs = {}
+            if Config.LLM_BASE_URL:
+                # OpenAI-compatible server, e.g. vLLM with --enable-prefix-caching
+                llm_kwargs["openai_api_base"] = Config.LLM_BASE_URL
+            
             llm = ChatOpenAI(
                 openai_api_key=Config.OPENAI_API_KEY,
                 model_name=Config.DEFAULT_MODEL,
                 temperature=Config.TEMPERATURE,
-                max_tokens=Config.MAX_TOKENS
+                max_tokens=Config.MAX_TOKENS,
+                streaming=True,
+                **llm_kwargs
             )
             logger.info(f"Initialized LLM: {Config.DEFAULT_MODEL}")
             return llm
@@ -69,12 +111,32 @@ class RAGSystem:
             logger.error(f"Error initializing QA chain: {e}")
             raise
     
+    def _retrieve_uncached(self, question: str, k: int, corpus_version: int) -> tuple:
+        """Vector search behind the retrieval cache; corpus_version is only a cache key"""
+        docs = tuple(_unique_documents(self.vector_store.get_relevant_documents(question, k=k)))
+        if not docs:
+            # The store reports errors as empty results; raising keeps them out of the cache
+            raise _EmptyRetrieval()
+        return docs
+    
+    def retrieve(self, question: str, k: int = None) -> List[LangchainDocument]:
+        """Distinct relevant documents for a question, memoized until the corpus changes
+        
+        Empty results are not memoized, so a transient search error is retried.
+        """
+        if k is None:
+            k = Config.TOP_K_RESULTS
+        try:
+            return list(self._retrieve_cached(question, k, self.vector_store.corpus_version))
+        except _EmptyRetrieval:
+            return []
+    
     def answer_question(self, question: str, use_relevant_docs: bool = True) -> Dict[str, Any]:
         """Answer a question using the RAG system"""
         try:
             if use_relevant_docs:
                 # Get relevant documents
-                relevant_docs = self.vector_store.get_relevant_documents(question)
+                relevant_docs = self.retrieve(question)
                 
                 if not relevant_docs:
                     return {
@@ -85,7 +147,7 @@ class RAGSystem:
                 
                 # Use QA chain with relevant documents
                 result = self.qa_chain({
-                    "input_documents": relevant_docs,
+                    "input_documents": _order_documents(relevant_docs),
                     "question": question
                 })
                 
@@ -117,7 +179,7 @@ class RAGSystem:
     def get_context_for_question(self, question: str, k: int = None) -> List[Dict[str, Any]]:
         """Get context documents for a question"""
         try:
-            relevant_docs = self.vector_store.get_relevant_documents(question, k=k)
+            relevant_docs = self.retrieve(question, k=k)
             
             context_info = []
             for doc in relevant_docs:
@@ -133,40 +195,54 @@ class RAGSystem:
             logger.error(f"Error getting context: {e}")
             return []
     
+    def _build_chat_prompt(self, question: str,
+                           chat_history: List[Dict[str, str]] = None) -> Tuple[str, List[LangchainDocument]]:
+        """Retrieve context and assemble the chat prompt"""
+        # Get relevant documents
+        relevant_docs = self.retrieve(question)
+        
+        # Build context from documents
+        context_parts = []
+        for doc in _order_documents(relevant_docs):
+            context_parts.append(f"Source: {doc.metadata.get('filename', 'Unknown')}\n{doc.page_content}")
+        
+        context = "\n\n".join(context_parts)
+        
+        # Build chat history context
+        history_context = ""
+        if chat_history:
+            # Keep the most recent messages that fit the token budget
+            encoding = _get_encoding(Config.DEFAULT_MODEL)
+            history_parts = []
+            used = 0
+            for msg in reversed(chat_history):
+                line = f"{msg['role']}: {msg['content']}"
+                used += len(encoding.encode(line, disallowed_special=()))
+                if used > Config.HISTORY_TOKEN_BUDGET:
+                    break
+                history_parts.append(line)
+            history_context = "\n".join(reversed(history_parts))
+        
+        # Stable content first (instructions, then documents) so repeated
+        # turns share the longest possible cacheable prompt prefix
+        enhanced_prompt = f"""You are a helpful AI assistant that answers questions based on provided documents and chat history.
+        Please provide a helpful answer based on the document context and chat history. If the information isn't available in the documents, say so and provide a general answer if possible.
+
+        Document Context:
+        {context}
+
+        Chat History:
+        {history_context}
+
+        Question: {question}"""
+        
+        return enhanced_prompt, relevant_docs
+    
     def chat_with_context(self, question: str, chat_history: List[Dict[str, str]] = None) -> Dict[str, Any]:
         """Enhanced chat with context from documents and chat history"""
         try:
-            # Get relevant documents
-            relevant_docs = self.vector_store.get_relevant_documents(question)
-            
-            # Build context from documents
-            context_parts = []
-            for doc in relevant_docs:
-                context_parts.append(f"Source: {doc.metadata.get('filename', 'Unknown')}\n{doc.page_content}")
+            enhanced_prompt, relevant_docs = self._build_chat_prompt(question, chat_history)
             
-            context = "\n\n".join(context_parts)
-            
-            # Build chat history context
-            history_context = ""
-            if chat_history:
-                history_parts = []
-                for msg in chat_history[-5:]:  # Last 5 messages
-                    history_parts.append(f"{msg['role']}: {msg['content']}")
-                history_context = "\n".join(history_parts)
-            
-            # Create enhanced prompt
-            enhanced_prompt = f"""You are a helpful AI assistant that answers questions based on provided documents and chat history.
-
-            Chat History:
-            {history_context}
-
-            Document Context:
-            {context}
-
-            Question: {question}
-
-            Please provide a helpful answer based on the document context and chat history. If the information isn't available in the documents, say so and provide a general answer if possible."""
-
             response = self.llm.predict(enhanced_prompt)
             
             return {
@@ -182,3 +258,35 @@ class RAGSystem:
                 "sources": [],
                 "confidence": "low"
             }
+    
+    def chat_with_context_stream(self, question: str, chat_history: List[Dict[str, str]] = None) -> Dict[str, Any]:
+        """Streaming variant of chat_with_context
+        
+        Retrieval happens up front; "answer_stream" yields the answer as the
+        LLM generates it, while "sources" and "confidence" are available
+        immediately.
+        """
+        try:
+            enhanced_prompt, relevant_docs = self._build_chat_prompt(question, chat_history)
+        except Exception as e:
+            logger.error(f"Error in chat with context: {e}")
+            return {
+                "answer_stream": iter([f"Sorry, I encountered an error: {str(e)}"]),
+                "sources": [],
+                "confidence": "low"
+            }
+        
+        return {
+            "answer_stream": self._stream_answer(enhanced_prompt),
+            "sources": [doc.metadata.get("source", "Unknown") for doc in relevant_docs],
+            "confidence": "high" if len(relevant_docs) > 0 else "medium"
+        }
+    
+    def _stream_answer(self, prompt: str) -> Iterator[str]:
+        """Yield answer text from the LLM token by token"""
+        try:
+            for chunk in self.llm.stream(prompt):
+                yield chunk.content
+        except Exception as e:
+            logger.error(f"Error streaming answer: {e}")
+            yield f"Sorry, I encountered an error: {str(e)}"
@@ -2,92 +2,675 @@
 Vector store management for document embeddings
 """
 import os
+import re
+import json
+import time
+import uuid
+import atexit
+import pickle
+import asyncio
+import sqlite3
 import logging
-from typing import List, Dict, Any, Optional
-import chromadb
-from chromadb.config import Settings
-from langchain.embeddings import OpenAIEmbeddings
-from langchain.vectorstores import Chroma
+import threading
+from abc import ABC, abstractmethod
+from bisect import bisect_right
+from functools import cached_property
+from collections import OrderedDict
+from itertools import islice
+from typing import List, Dict, Any, Optional, Iterable, Set, Tuple, Callable
+import numpy as np
+from tqdm import tqdm
+import openai
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_random_exponential
+from langchain.embeddings.base import Embeddings
 from langchain.schema import Document as LangchainDocument
+# Same fingerprint DocumentProcessor stores in chunk metadata
+from document_processor import _content_hash
 from config import Config
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-class VectorStore:
-    """Manages vector database operations"""
+COLLECTION_NAME = "pdf_documents"
+
+# Embedding failures worth backing off on; bad requests and auth errors are not
+_TRANSIENT_API_ERRORS = (openai.RateLimitError, openai.APIConnectionError, openai.APITimeoutError)
+
+
+class _IngestCache:
+    """SQLite-backed record of ingested files and content-hash -> embedding cache"""
+    
+    def __init__(self, path: str, model: str, store: str):
+        self.model = model
+        self.store = store
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "model TEXT NOT NULL, hash TEXT NOT NULL, vec BLOB NOT NULL, "
+            "PRIMARY KEY (model, hash))"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS store_files ("
+            "store TEXT NOT NULL, hash TEXT NOT NULL, chunk_ids TEXT NOT NULL, "
+            "PRIMARY KEY (store, hash))"
+        )
+        # WAL keeps the deferred commits below cheap and readers unblocked
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.commit()
+    
+    def get_many(self, hashes: List[str]) -> Dict[str, List[float]]:
+        """Return cached embeddings for whichever hashes are present"""
+        found = {}
+        unique = list(set(hashes))
+        with self._lock:
+            # Stay well below SQLite's bound-parameter limit
+            for i in range(0, len(unique), 500):
+                part = unique[i:i + 500]
+                placeholders = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT hash, vec FROM embeddings WHERE model = ? AND hash IN ({placeholders})",
+                    [self.model, *part]
+                )
+                for h, blob in rows:
+                    found[h] = np.frombuffer(blob, dtype=np.float32).tolist()
+        return found
+    
+    def put_many(self, hashes: List[str], vectors: List[List[float]]):
+        """Store embeddings, keeping any existing entry for the same hash (uncommitted)"""
+        rows = [
+            (self.model, h, np.asarray(v, dtype=np.float32).tobytes())
+            for h, v in zip(hashes, vectors)
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (model, hash, vec) VALUES (?, ?, ?)", rows
+            )
+    
+    def file_hashes(self) -> Set[str]:
+        """Hashes of every file whose chunks are in this store"""
+        with self._lock:
+            rows = self._conn.execute("SELECT hash FROM store_files WHERE store = ?", (self.store,))
+            return {h for (h,) in rows}
+    
+    def add_file_chunks(self, file_chunk_ids: Dict[str, List[str]]):
+        """Record the chunk IDs written for each source file (uncommitted)"""
+        rows = [(self.store, h, ",".join(ids)) for h, ids in file_chunk_ids.items()]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO store_files (store, hash, chunk_ids) VALUES (?, ?, ?) "
+                "ON CONFLICT(store, hash) DO UPDATE SET chunk_ids = chunk_ids || ',' || excluded.chunk_ids",
+                rows
+            )
+    
+    def commit(self):
+        """Make writes since the last commit durable; done once per ingest, not per batch"""
+        with self._lock:
+            self._conn.commit()
+    
+    def clear_files(self):
+        """Forget all files ingested into this store; cached embeddings stay valid"""
+        with self._lock:
+            self._conn.execute("DELETE FROM store_files WHERE store = ?", (self.store,))
+            self._conn.commit()
+
+
+class _FAISSDocStore:
+    """SQLite table of chunk text and metadata keyed by FAISS label"""
+    
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            "label INTEGER PRIMARY KEY, chunk_id TEXT NOT NULL, "
+            "text TEXT NOT NULL, metadata TEXT NOT NULL)"
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.commit()
+    
+    def add(self, labels: Iterable[int], ids: List[str], texts: List[str],
+            metadatas: List[Dict[str, Any]]):
+        """Store chunks under their index labels (uncommitted)"""
+        rows = [
+            (label, chunk_id, text, json.dumps(metadata))
+            for label, chunk_id, text, metadata in zip(labels, ids, texts, metadatas)
+        ]
+        with self._lock:
+            # Labels past the last saved index may be left over from a crash
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO chunks (label, chunk_id, text, metadata) VALUES (?, ?, ?, ?)",
+                rows
+            )
+    
+    def get_many(self, labels: List[int]) -> Dict[int, Tuple[str, Dict[str, Any]]]:
+        """Return (text, metadata) for whichever labels are present"""
+        if not labels:
+            return {}
+        placeholders = ",".join("?" * len(labels))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT label, text, metadata FROM chunks WHERE label IN ({placeholders})",
+                labels
+            ).fetchall()
+        return {label: (text, json.loads(metadata)) for label, text, metadata in rows}
+    
+    def commit(self):
+        """Make added chunks durable"""
+        with self._lock:
+            self._conn.commit()
+    
+    def delete(self, ids: List[str]):
+        """Remove chunks by chunk ID (uncommitted); their vectors stay in the index unreferenced"""
+        with self._lock:
+            for i in range(0, len(ids), 500):
+                part = ids[i:i + 500]
+                placeholders = ",".join("?" * len(part))
+                self._conn.execute(f"DELETE FROM chunks WHERE chunk_id IN ({placeholders})", part)
+    
+    def clear(self):
+        """Remove every chunk"""
+        with self._lock:
+            self._conn.execute("DELETE FROM chunks")
+            self._conn.commit()
+
+
+class _SemanticCache:
+    """LRU cache of search results keyed by query, matched exactly or by embedding similarity
+    
+    Cached query embeddings are unit-normalised and stored as uint8 codes with a
+    per-row affine scale and offset (a quarter of the float32 footprint), so a
+    near-duplicate query is found with a single matrix-vector product instead
+    of a round-trip to the vector database. Only the incoming query stays fp32.
+    """
+    
+    def __init__(self, max_size: int, threshold: float):
+        self.max_size = max_size
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # query -> results
+        self._keys: List[str] = []     # query for each stored row
+        self._codes = None             # (n, dim) uint8
+        self._scales = None            # (n,) float32
+        self._zeros = None             # (n,) float32
+    
+    def get(self, query: str) -> Optional[Any]:
+        """Results for an identical query, if cached"""
+        with self._lock:
+            if query not in self._entries:
+                return None
+            self._entries.move_to_end(query)
+            return self._entries[query]
+    
+    def get_similar(self, query_embedding: List[float]) -> Optional[Any]:
+        """Results for the most similar cached query, if it clears the threshold"""
+        with self._lock:
+            if self._codes is None:
+                return None
+            q = _normalize(query_embedding)
+            # dot(q, codes * scale + zero) without dequantizing the matrix
+            sims = (self._codes @ q) * self._scales + self._zeros * q.sum()
+            best = int(np.argmax(sims))
+            if sims[best] < self.threshold:
+                return None
+            key = self._keys[best]
+            self._entries.move_to_end(key)
+            return self._entries[key]
+    
+    def put(self, query: str, query_embedding: List[float], results: Any):
+        """Cache results, evicting the least recently used query when full"""
+        with self._lock:
+            if query in self._entries:
+                self._entries[query] = results
+                self._entries.move_to_end(query)
+                return
+            
+            if len(self._entries) >= self.max_size:
+                evicted, _ = self._entries.popitem(last=False)
+                row = self._keys.index(evicted)
+                del self._keys[row]
+                self._codes = np.delete(self._codes, row, axis=0)
+                self._scales = np.delete(self._scales, row)
+                self._zeros = np.delete(self._zeros, row)
+            
+            self._entries[query] = results
+            self._keys.append(query)
+            codes, scale, zero = _quantize(_normalize(query_embedding))
+            if self._codes is None:
+                self._codes = codes[np.newaxis, :]
+                self._scales = np.array([scale], dtype=np.float32)
+                self._zeros = np.array([zero], dtype=np.float32)
+            else:
+                self._codes = np.vstack([self._codes, codes])
+                self._scales = np.append(self._scales, np.float32(scale))
+                self._zeros = np.append(self._zeros, np.float32(zero))
+
+
+def _quantize(vector: np.ndarray) -> Tuple[np.ndarray, float, float]:
+    """Affine-quantize a float vector to uint8 codes, returning (codes, scale, zero)"""
+    low, high = float(vector.min()), float(vector.max())
+    scale = (high - low) / 255 or 1.0
+    codes = np.round((vector - low) / scale).astype(np.uint8)
+    return codes, scale, low
+
+
+class _CachedQueryEmbeddings(Embeddings):
+    """Embeddings wrapper that keeps an LRU of query embeddings
+    
+    Document embeddings pass straight through (they have their own
+    content-hash cache); repeated query strings skip the API round-trip.
+    """
+    
+    def __init__(self, embeddings: Embeddings, max_size: int):
+        self.embeddings = embeddings
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._queries = OrderedDict()
+    
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+    
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.embeddings.aembed_documents(texts)
+    
+    def embed_query(self, text: str) -> List[float]:
+        with self._lock:
+            if text in self._queries:
+                self._queries.move_to_end(text)
+                return self._queries[text]
+        
+        embedding = self.embeddings.embed_query(text)
+        with self._lock:
+            self._queries[text] = embedding
+            if len(self._queries) > self.max_size:
+                self._queries.popitem(last=False)
+        return embedding
+    
+    def load(self, path: str):
+        """Restore query embeddings saved by a previous run"""
+        try:
+            with open(path, "rb") as f:
+                saved = pickle.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable query embedding cache: {e}")
+            return
+        with self._lock:
+            saved.update(self._queries)
+            self._queries = OrderedDict(list(saved.items())[-self.max_size:])
+    
+    def save(self, path: str):
+        """Write the query embeddings to disk"""
+        with self._lock:
+            snapshot = OrderedDict(self._queries)
+        try:
+            with open(path, "wb") as f:
+                pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            logger.error(f"Error saving query embedding cache: {e}")
+
+
+def _normalize(vector: List[float]) -> np.ndarray:
+    """Unit-length float32 copy of a vector so dot products are cosine similarities"""
+    v = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(v)
+    return v / norm if norm else v
+
+
+def _relevance_scores(distances: np.ndarray, space: str) -> np.ndarray:
+    """Map Chroma distances to [0, 1] relevance scores for the collection's space
+    
+    Uses the same conversions as LangChain's Chroma relevance score functions.
+    """
+    if space == "cosine":
+        return 1.0 - distances
+    if space == "ip":
+        return np.where(distances > 0, 1.0 - distances, -distances)
+    return 1.0 - distances / np.sqrt(2)
+
+
+def _mmr_select(query_embedding: List[float], candidates: np.ndarray, k: int,
+                lambda_mult: float) -> List[int]:
+    """Greedy maximal marginal relevance order over candidate embeddings
+    
+    All query and pairwise similarities come from two matrix products up
+    front; each step then only updates a running max over selected rows.
+    """
+    n = len(candidates)
+    if n == 0:
+        return []
+    norms = np.linalg.norm(candidates, axis=1, keepdims=True)
+    embeddings = candidates / np.where(norms == 0, 1.0, norms)
+    query_sims = embeddings @ _normalize(query_embedding)
+    doc_sims = embeddings @ embeddings.T
+    
+    selected_mask = np.zeros(n, dtype=bool)
+    selected = [int(np.argmax(query_sims))]
+    selected_mask[selected[0]] = True
+    # Highest similarity of each candidate to anything already selected
+    redundancy = doc_sims[:, selected[0]].copy()
+    while len(selected) < min(k, n):
+        scores = lambda_mult * query_sims - (1 - lambda_mult) * redundancy
+        scores[selected_mask] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        selected_mask[best] = True
+        np.maximum(redundancy, doc_sims[:, best], out=redundancy)
+    return selected
+
+
+def _embedding_model_key() -> str:
+    """Identifies the embedding space, so cached vectors never mix models or sizes"""
+    return f"{Config.EMBEDDING_MODEL}-{Config.EMBEDDING_DIM}"
+
+
+def _store_name() -> str:
+    """Collection / index name; each embedding space gets its own store"""
+    return f"{COLLECTION_NAME}-{_embedding_model_key()}"
+
+
+class VectorStore(ABC):
+    """Manages vector database operations
+    
+    Embedding, caching and search logic is shared; subclasses supply the
+    index that stores and searches the vectors.
+    """
+    
+    # Name selected by Config.VECTOR_BACKEND
+    BACKEND: str = None
     
     def __init__(self):
-        self.embeddings = OpenAIEmbeddings(
-            openai_api_key=Config.OPENAI_API_KEY,
-            model=Config.EMBEDDING_MODEL
+        # Bumped whenever the stored corpus changes; retrieval caches key on it
+        self.corpus_version = 0
+        # One semantic cache per (search kind, k); emptied when the corpus changes
+        self._query_caches: Dict[Tuple, _SemanticCache] = {}
+        self._flush_registered = False
+        # (timestamp, count) so UI reruns do not re-count the collection
+        self._count_cache = None
+        self._query_cache_path = os.path.join(
+            Config.CHROMA_PERSIST_DIRECTORY, f"query_embeddings_{_embedding_model_key()}.pkl"
         )
-        self.vectorstore = None
         self._initialize_vectorstore()
     
+    @cached_property
+    def embeddings(self) -> _CachedQueryEmbeddings:
+        """OpenAI embeddings behind the query cache, built on first use"""
+        from langchain.embeddings import OpenAIEmbeddings
+        
+        embeddings = _CachedQueryEmbeddings(
+            OpenAIEmbeddings(
+                openai_api_key=Config.OPENAI_API_KEY,
+                model=Config.EMBEDDING_MODEL,
+                dimensions=Config.EMBEDDING_DIM,
+                # One HTTP request per ingest batch
+                chunk_size=Config.EMBEDDING_BATCH_SIZE
+            ),
+            max_size=Config.QUERY_EMBEDDING_CACHE_SIZE
+        )
+        # Reload query embeddings from earlier runs
+        embeddings.load(self._query_cache_path)
+        return embeddings
+    
     def _initialize_vectorstore(self):
-        """Initialize the Chroma vector store"""
+        """Initialize caches and open the backend index"""
         try:
             # Create directory if it doesn't exist
             os.makedirs(Config.CHROMA_PERSIST_DIRECTORY, exist_ok=True)
             
-            # Initialize Chroma
-            self.vectorstore = Chroma(
-                persist_directory=Config.CHROMA_PERSIST_DIRECTORY,
-                embedding_function=self.embeddings,
-                collection_name="pdf_documents"
+            # Embeddings are cached by chunk content so re-ingests skip the API
+            self.ingest_cache = _IngestCache(
+                os.path.join(Config.CHROMA_PERSIST_DIRECTORY, "embedding_cache.sqlite"),
+                _embedding_model_key(),
+                f"{self.BACKEND}/{_store_name()}"
             )
+            
+            # Flush caches on exit
+            if not self._flush_registered:
+                atexit.register(self.flush)
+                self._flush_registered = True
+            
+            self._open_index()
             logger.info("Vector store initialized successfully")
         except Exception as e:
             logger.error(f"Error initializing vector store: {e}")
             raise
     
-    def add_documents(self, documents: List[LangchainDocument]) -> bool:
-        """Add documents to the vector store"""
+    def add_documents(self, documents: Iterable[LangchainDocument],
+                      on_progress: Optional[Callable[[int], None]] = None) -> bool:
+        """Add documents to the vector store
+        
+        Synchronous wrapper around aadd_documents; must not be called from a
+        thread that is already running an event loop.
+        """
+        return asyncio.run(self.aadd_documents(documents, on_progress))
+    
+    async def aadd_documents(self, documents: Iterable[LangchainDocument],
+                             on_progress: Optional[Callable[[int], None]] = None) -> bool:
+        """Add documents to the vector store, embedding batches concurrently
+        
+        Accepts any iterable, including the chunk generators produced by
+        DocumentProcessor, and consumes it EMBEDDING_CONCURRENCY batches at a
+        time so memory and in-flight API requests both stay bounded.
+        
+        Files are recorded as ingested only once every chunk has been
+        stored; if anything fails, the chunks written so far are removed.
+        on_progress, if given, is called with the size of each stored batch.
+        """
+        written_ids = []
+        file_chunk_ids = {}
         try:
-            if not documents:
+            iterator = iter(documents)
+            total = 0
+            
+            with tqdm(desc="Embedding chunks", unit="chunk") as progress:
+                while True:
+                    batches = []
+                    for _ in range(Config.EMBEDDING_CONCURRENCY):
+                        batch = list(islice(iterator, Config.EMBEDDING_BATCH_SIZE))
+                        if not batch:
+                            break
+                        batches.append(batch)
+                    if not batches:
+                        break
+                    
+                    # Overlap the embedding round-trips, then write in order
+                    results = await asyncio.gather(*(self._aembed_batch(batch) for batch in batches))
+                    for batch, embeddings in zip(batches, results):
+                        ids = self._write_batch(batch, embeddings)
+                        written_ids.extend(ids)
+                        for doc, chunk_id in zip(batch, ids):
+                            file_hash = doc.metadata.get("file_hash")
+                            if file_hash:
+                                file_chunk_ids.setdefault(file_hash, []).append(chunk_id)
+                        total += len(batch)
+                        progress.update(len(batch))
+                        if on_progress:
+                            on_progress(len(batch))
+            
+            if not total:
                 logger.warning("No documents to add")
                 return False
             
-            # Add documents to Chroma
-            self.vectorstore.add_documents(documents)
-            
-            # Persist the changes
-            self.vectorstore.persist()
+            # Remember which files these chunks came from for ingest dedup
+            if file_chunk_ids:
+                self.ingest_cache.add_file_chunks(file_chunk_ids)
+            self._corpus_changed()
             
-            logger.info(f"Added {len(documents)} documents to vector store")
+            logger.info(f"Added {total} documents to vector store")
             return True
         except Exception as e:
             logger.error(f"Error adding documents: {e}")
+            self._discard(written_ids)
             return False
+        finally:
+            # Embeddings stay cached even if the ingest failed, so a retry is cheap
+            self.ingest_cache.commit()
+            self._persist()
+    
+    def flush(self):
+        """Write cached embeddings and ingest records to disk
+        
+        Runs automatically at exit; call it explicitly between phases of a
+        long-running process if needed.
+        """
+        try:
+            self.ingest_cache.commit()
+            self._persist()
+            # Nothing to save if no query was ever embedded
+            if "embeddings" in self.__dict__:
+                self.embeddings.save(self._query_cache_path)
+        except Exception as e:
+            logger.error(f"Error flushing vector store caches: {e}")
+    
+    @retry(retry=retry_if_exception_type(_TRANSIENT_API_ERRORS),
+           wait=wait_random_exponential(min=1, max=30), stop=stop_after_attempt(5), reraise=True)
+    async def _aembed_texts(self, texts: List[str]) -> List[List[float]]:
+        """One embed_documents request, retried with exponential backoff on transient errors"""
+        return await self.embeddings.aembed_documents(texts)
+    
+    async def _aembed_batch(self, documents: List[LangchainDocument]) -> List[List[float]]:
+        """Embeddings for a batch, requesting only chunks missing from the cache"""
+        texts = [doc.page_content for doc in documents]
+        hashes = [doc.metadata.get("content_hash") or _content_hash(text)
+                  for doc, text in zip(documents, texts)]
+        
+        # Only embed distinct chunk texts that have not been seen before
+        cached = self.ingest_cache.get_many(hashes)
+        missing = {}
+        for text, h in zip(texts, hashes):
+            if h not in cached and h not in missing:
+                missing[h] = text
+        if missing:
+            vectors = await self._aembed_texts(list(missing.values()))
+            missing_hashes = list(missing)
+            self.ingest_cache.put_many(missing_hashes, vectors)
+            cached.update(zip(missing_hashes, vectors))
+        if len(missing) < len(documents):
+            logger.info("Reused %d embeddings from cache or duplicates", len(documents) - len(missing))
+        
+        return [cached[h] for h in hashes]
     
-    def similarity_search(self, query: str, k: int = None) -> List[LangchainDocument]:
+    def _write_batch(self, documents: List[LangchainDocument], embeddings: List[List[float]]) -> List[str]:
+        """Write an embedded batch to the collection, returning the new chunk IDs"""
+        texts = [doc.page_content for doc in documents]
+        ids = [str(uuid.uuid4()) for _ in documents]
+        metadatas = [doc.metadata for doc in documents]
+        
+        self._upsert(ids, embeddings, texts, metadatas)
+        return ids
+    
+    def _discard(self, ids: List[str]):
+        """Remove the chunks of a failed ingest so files can be retried cleanly"""
+        if not ids:
+            return
+        try:
+            self._delete(ids)
+            self._corpus_changed()
+        except Exception as e:
+            logger.error(f"Error removing chunks of failed ingest: {e}")
+    
+    def _corpus_changed(self):
+        """Invalidate everything derived from the stored documents"""
+        self.corpus_version += 1
+        self._query_caches.clear()
+        self._count_cache = None
+    
+    def _embed_query(self, query: str) -> List[float]:
+        """Query embedding, served from the query-embedding LRU when possible"""
+        return self.embeddings.embed_query(query)
+    
+    def _cached_search(self, kind: str, query: str, k: int,
+                       search: Callable[[List[float]], List[Any]],
+                       query_embedding: Optional[List[float]] = None) -> List[Any]:
+        """Run search(query_embedding) behind the semantic query cache
+        
+        Pass query_embedding when the caller already has it; otherwise the
+        query is embedded only if there is no exact cache hit.
+        """
+        cache = self._query_caches.get((kind, k))
+        if cache is None:
+            cache = self._query_caches.setdefault(
+                (kind, k),
+                _SemanticCache(Config.SEMANTIC_CACHE_SIZE, Config.SEMANTIC_CACHE_THRESHOLD)
+            )
+        
+        results = cache.get(query)
+        if results is not None:
+            return results
+        
+        if query_embedding is None:
+            query_embedding = self._embed_query(query)
+        results = cache.get_similar(query_embedding)
+        if results is not None:
+            return results
+        
+        results = search(query_embedding)
+        cache.put(query, query_embedding, results)
+        return results
+    
+    def _scored_search(self, query: str, k: int,
+                       query_embedding: Optional[List[float]]) -> List[Tuple[LangchainDocument, float]]:
+        """Cached (document, distance) pairs shared by both similarity searches"""
+        return self._cached_search(
+            "similarity", query, k,
+            lambda embedding: self._query(embedding, k),
+            query_embedding
+        )
+    
+    def similarity_search(self, query: str, k: int = None,
+                          query_embedding: Optional[List[float]] = None) -> List[LangchainDocument]:
         """Search for similar documents"""
         try:
             if k is None:
                 k = Config.TOP_K_RESULTS
             
-            results = self.vectorstore.similarity_search(query, k=k)
-            logger.info(f"Found {len(results)} similar documents")
+            results = [doc for doc, _ in self._scored_search(query, k, query_embedding)]
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("Found %d similar documents", len(results))
             return results
         except Exception as e:
             logger.error(f"Error in similarity search: {e}")
             return []
     
-    def similarity_search_with_score(self, query: str, k: int = None) -> List[tuple]:
+    def similarity_search_with_score(self, query: str, k: int = None,
+                                     query_embedding: Optional[List[float]] = None) -> List[tuple]:
         """Search for similar documents with similarity scores"""
         try:
             if k is None:
                 k = Config.TOP_K_RESULTS
             
-            results = self.vectorstore.similarity_search_with_score(query, k=k)
-            logger.info(f"Found {len(results)} similar documents with scores")
+            # Scores are distances (lower is more similar)
+            results = self._scored_search(query, k, query_embedding)
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("Found %d similar documents with scores", len(results))
             return results
         except Exception as e:
             logger.error(f"Error in similarity search with score: {e}")
             return []
     
-    def get_relevant_documents(self, query: str, k: int = None, threshold: float = None) -> List[LangchainDocument]:
+    def max_marginal_relevance_search(self, query: str, k: int = 5, fetch_k: int = 25,
+                                      lambda_mult: float = 0.5,
+                                      query_embedding: Optional[List[float]] = None) -> List[LangchainDocument]:
+        """Search for documents that are relevant to the query but not to each other
+        
+        fetch_k nearest chunks are re-ranked by MMR; lambda_mult weighs
+        relevance (1.0) against diversity (0.0).
+        """
+        try:
+            def search(embedding):
+                documents, vectors = self._query_vectors(embedding, fetch_k)
+                return [documents[i] for i in _mmr_select(embedding, vectors, k, lambda_mult)]
+            
+            results = self._cached_search(f"mmr:{fetch_k}:{lambda_mult}", query, k, search, query_embedding)
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("Found %d diverse documents", len(results))
+            return results
+        except Exception as e:
+            logger.error(f"Error in max marginal relevance search: {e}")
+            return []
+    
+    def get_relevant_documents(self, query: str, k: int = None, threshold: float = None,
+                               query_embedding: Optional[List[float]] = None) -> List[LangchainDocument]:
         """Get relevant documents above similarity threshold"""
         try:
             if k is None:
@@ -96,28 +679,37 @@ class VectorStore:
                 threshold = Config.SIMILARITY_THRESHOLD
             
             # Get results with scores
-            results_with_scores = self.similarity_search_with_score(query, k=k)
-            
-            # Filter by threshold (lower score = more similar in Chroma)
-            relevant_docs = []
-            for doc, score in results_with_scores:
-                # Chroma uses cosine distance, so lower is better
-                # Convert to similarity score (1 - distance)
-                similarity = 1 - score
-                if similarity >= threshold:
-                    relevant_docs.append(doc)
-            
-            logger.info(f"Found {len(relevant_docs)} relevant documents above threshold {threshold}")
+            results_with_scores = self.similarity_search_with_score(query, k=k, query_embedding=query_embedding)
+            
+            # Filter by threshold (lower distance = more similar)
+            distances = np.fromiter((score for _, score in results_with_scores),
+                                    dtype=np.float32, count=len(results_with_scores))
+            relevance = _relevance_scores(distances, self._distance_space())
+            keep = np.flatnonzero(relevance >= threshold)
+            relevant_docs = [results_with_scores[i][0] for i in keep]
+            
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("Found %d relevant documents above threshold %s", len(relevant_docs), threshold)
             return relevant_docs
         except Exception as e:
             logger.error(f"Error getting relevant documents: {e}")
             return []
     
+    def ingested_file_hashes(self) -> Set[str]:
+        """Content hashes of files already in the vector store"""
+        try:
+            return self.ingest_cache.file_hashes()
+        except Exception as e:
+            logger.error(f"Error reading ingested files: {e}")
+            return set()
+    
     def delete_collection(self):
         """Delete the entire collection"""
         try:
             # This will delete all data in the collection
-            self.vectorstore.delete_collection()
+            self._drop_index()
+            self.ingest_cache.clear_files()
+            self._corpus_changed()
             logger.info("Collection deleted successfully")
         except Exception as e:
             logger.error(f"Error deleting collection: {e}")
@@ -125,12 +717,15 @@ class VectorStore:
     def get_collection_info(self) -> Dict[str, Any]:
         """Get information about the collection"""
         try:
-            # Get collection count
-            count = self.vectorstore._collection.count()
+            # Get collection count, reusing a recent value
+            now = time.monotonic()
+            if self._count_cache is None or now - self._count_cache[0] >= Config.COLLECTION_COUNT_TTL:
+                self._count_cache = (now, self._count())
+            count = self._count_cache[1]
             return {
                 "document_count": count,
                 "persist_directory": Config.CHROMA_PERSIST_DIRECTORY,
-                "collection_name": "pdf_documents"
+                "collection_name": _store_name()
             }
         except Exception as e:
             logger.error(f"Error getting collection info: {e}")
@@ -139,8 +734,389 @@ class VectorStore:
     def clear_database(self):
         """Clear all documents from the database"""
         try:
+            # Embeddings, caches and the client stay; only the index is dropped
+            # and the collection is recreated empty on next use
             self.delete_collection()
-            self._initialize_vectorstore()
             logger.info("Database cleared successfully")
         except Exception as e:
             logger.error(f"Error clearing database: {e}")
+    
+    @abstractmethod
+    def _open_index(self):
+        """Open or create the backend index"""
+    
+    @abstractmethod
+    def _upsert(self, ids: List[str], embeddings: List[List[float]], texts: List[str],
+                metadatas: List[Dict[str, Any]]):
+        """Write embedded chunks to the index"""
+    
+    @abstractmethod
+    def _delete(self, ids: List[str]):
+        """Remove chunks by ID"""
+    
+    @abstractmethod
+    def _query(self, query_embedding: List[float], k: int) -> List[Tuple[LangchainDocument, float]]:
+        """Nearest chunks to an embedding as (document, distance) pairs"""
+    
+    @abstractmethod
+    def _query_vectors(self, query_embedding: List[float], k: int) -> Tuple[List[LangchainDocument], np.ndarray]:
+        """Nearest chunks to an embedding and their embeddings as a (k, dim) array"""
+    
+    @abstractmethod
+    def _count(self) -> int:
+        """Number of chunks in the index"""
+    
+    @abstractmethod
+    def _drop_index(self):
+        """Delete every chunk from the index"""
+    
+    @abstractmethod
+    def _distance_space(self) -> str:
+        """Distance function of the index: cosine, ip or l2"""
+    
+    def _persist(self):
+        """Write pending index changes to disk; a no-op for write-through backends"""
+
+
+class ChromaVectorStore(VectorStore):
+    """Vector store backed by a Chroma collection"""
+    
+    BACKEND = "chroma"
+    
+    @cached_property
+    def client(self):
+        """Embedded Chroma by default, or a Chroma server in server mode
+        
+        Server mode (`chroma run --path ./chroma_db --port 8001`) moves HNSW
+        work into its own process so concurrent sessions are not serialized
+        on this one.
+        """
+        import chromadb
+        
+        if Config.CHROMA_SERVER_MODE:
+            logger.info(f"Connecting to Chroma server at {Config.CHROMA_HOST}:{Config.CHROMA_PORT}")
+            return chromadb.HttpClient(host=Config.CHROMA_HOST, port=Config.CHROMA_PORT)
+        return chromadb.PersistentClient(path=Config.CHROMA_PERSIST_DIRECTORY)
+    
+    @cached_property
+    def collection(self):
+        """The Chroma collection, opened (and its HNSW index loaded) on first use
+        
+        An existing collection is opened as-is. get_or_create_collection with
+        metadata would overwrite its stored settings, leaving them out of
+        step with the index it was built with (e.g. l2 reported as cosine).
+        """
+        # Embeddings are always computed here and passed in, so the
+        # collection needs no embedding function of its own
+        try:
+            return self.client.get_collection(_store_name(), embedding_function=None)
+        except Exception:
+            # Missing; HTTP and embedded clients raise different types for this
+            pass
+        try:
+            # HNSW settings are fixed when the collection is created
+            return self.client.create_collection(
+                _store_name(),
+                metadata={
+                    "hnsw:space": "cosine",
+                    "hnsw:M": Config.HNSW_M,
+                    "hnsw:construction_ef": Config.HNSW_CONSTRUCTION_EF,
+                    "hnsw:search_ef": Config.HNSW_SEARCH_EF,
+                    "hnsw:num_threads": os.cpu_count() or 1
+                },
+                embedding_function=None
+            )
+        except Exception:
+            # Created concurrently by another session or process
+            return self.client.get_collection(_store_name(), embedding_function=None)
+    
+    def _open_index(self):
+        """Nothing to do up front; the collection is opened on first use"""
+    
+    def _upsert(self, ids: List[str], embeddings: List[List[float]], texts: List[str],
+                metadatas: List[Dict[str, Any]]):
+        """Write embedded chunks to the collection"""
+        # Write in Chroma-sized batches to amortize per-transaction and
+        # HNSW update overhead without building one huge request
+        step = Config.CHROMA_ADD_BATCH_SIZE
+        for i in range(0, len(ids), step):
+            self.collection.upsert(
+                ids=ids[i:i + step],
+                embeddings=embeddings[i:i + step],
+                documents=texts[i:i + step],
+                metadatas=metadatas[i:i + step]
+            )
+    
+    def _delete(self, ids: List[str]):
+        """Remove chunks from the collection"""
+        step = Config.CHROMA_ADD_BATCH_SIZE
+        for i in range(0, len(ids), step):
+            self.collection.delete(ids=ids[i:i + step])
+    
+    def _query(self, query_embedding: List[float], k: int) -> List[Tuple[LangchainDocument, float]]:
+        """Nearest chunks to an embedding as (document, distance) pairs"""
+        result = self.collection.query(
+            query_embeddings=[query_embedding],
+            n_results=k,
+            include=["documents", "metadatas", "distances"]
+        )
+        return [
+            (LangchainDocument(page_content=text, metadata=metadata or {}), distance)
+            for text, metadata, distance in zip(
+                result["documents"][0], result["metadatas"][0], result["distances"][0]
+            )
+        ]
+    
+    def _query_vectors(self, query_embedding: List[float], k: int) -> Tuple[List[LangchainDocument], np.ndarray]:
+        """Nearest chunks to an embedding and their stored embeddings"""
+        result = self.collection.query(
+            query_embeddings=[query_embedding],
+            n_results=k,
+            include=["documents", "metadatas", "embeddings"]
+        )
+        documents = [
+            LangchainDocument(page_content=text, metadata=metadata or {})
+            for text, metadata in zip(result["documents"][0], result["metadatas"][0])
+        ]
+        return documents, np.asarray(result["embeddings"][0], dtype=np.float32)
+    
+    def _count(self) -> int:
+        """Number of chunks in the collection"""
+        return self.collection.count()
+    
+    def _drop_index(self):
+        """Delete the collection"""
+        self.client.delete_collection(_store_name())
+        self.__dict__.pop("collection", None)
+    
+    def _distance_space(self) -> str:
+        """Distance function the collection's HNSW index was built with"""
+        metadata = self.collection.metadata or {}
+        return metadata.get("hnsw:space", "l2")
+
+
+class FAISSVectorStore(VectorStore):
+    """Vector store backed by FAISS HNSW index segments memory-mapped from disk
+    
+    Each ingest adds its vectors to a new in-memory segment. On persist the
+    segment is written to its own file and mapped back read-only with
+    IO_FLAG_MMAP_IFC, so neither a restart nor a small ingest reads or
+    rewrites the existing index. A segment is merged into the one before it
+    once that one is less than SEGMENT_MERGE_FACTOR times its size, which
+    keeps the segment count logarithmic in the corpus size.
+    
+    Labels are contiguous across segments; chunk text and metadata live in
+    a SQLite table keyed by label. Vectors are unit-normalised and searched
+    by inner product, so distances are cosine distances as with Chroma.
+    """
+    
+    BACKEND = "faiss"
+    SEGMENT_MERGE_FACTOR = 2
+    
+    def __init__(self):
+        self._segments = []  # (first label, mapped index) in label order
+        self._pending = None  # in-memory segment not yet written
+        self._pending_start = 0
+        self._docstore = None
+        self._index_lock = threading.Lock()
+        self._segment_prefix = os.path.join(Config.CHROMA_PERSIST_DIRECTORY, f"faiss-{_store_name()}")
+        super().__init__()
+    
+    def _segment_path(self, start: int) -> str:
+        return f"{self._segment_prefix}.{start:012d}.index"
+    
+    def _saved_segment_starts(self) -> List[int]:
+        """First labels of the segment files on disk, in order"""
+        directory, name = os.path.split(self._segment_prefix)
+        pattern = re.compile(re.escape(name) + r"\.(\d+)\.index")
+        starts = []
+        for filename in os.listdir(directory):
+            match = pattern.fullmatch(filename)
+            if match:
+                starts.append(int(match.group(1)))
+        return sorted(starts)
+    
+    def _map_segment(self, start: int):
+        """Map a saved segment read-only; its vectors are paged in on demand"""
+        import faiss
+        
+        index = faiss.read_index(self._segment_path(start), faiss.IO_FLAG_MMAP_IFC)
+        index.hnsw.efSearch = Config.HNSW_SEARCH_EF
+        return index
+    
+    def _write_segment(self, start: int, index):
+        """Write a segment beside its file and swap it in, so mapped readers stay valid"""
+        import faiss
+        
+        path = self._segment_path(start)
+        faiss.write_index(index, path + ".tmp")
+        os.replace(path + ".tmp", path)
+    
+    def _end_label(self) -> int:
+        """Label the next saved vector will get"""
+        if not self._segments:
+            return 0
+        start, index = self._segments[-1]
+        return start + index.ntotal
+    
+    def _searchable(self) -> List[Tuple[int, Any]]:
+        segments = list(self._segments)
+        if self._pending is not None:
+            segments.append((self._pending_start, self._pending))
+        return segments
+    
+    def _open_index(self):
+        """Map the saved segments from disk"""
+        if self._docstore is None:
+            self._docstore = _FAISSDocStore(
+                os.path.join(Config.CHROMA_PERSIST_DIRECTORY, f"faiss_docs-{_store_name()}.sqlite")
+            )
+        with self._index_lock:
+            # Unmap every segment first; a mapped file cannot be removed on Windows
+            self._segments = []
+            self._pending = None
+            for start in self._saved_segment_starts():
+                if start < self._end_label():
+                    # Already merged into the previous segment when a merge was interrupted
+                    os.remove(self._segment_path(start))
+                    continue
+                self._segments.append((start, self._map_segment(start)))
+    
+    def _upsert(self, ids: List[str], embeddings: List[List[float]], texts: List[str],
+                metadatas: List[Dict[str, Any]]):
+        """Append embedded chunks to the pending segment; saved by _persist"""
+        import faiss
+        
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        faiss.normalize_L2(vectors)
+        with self._index_lock:
+            if self._pending is None:
+                self._pending = faiss.IndexHNSWFlat(
+                    vectors.shape[1], Config.HNSW_M, faiss.METRIC_INNER_PRODUCT
+                )
+                self._pending.hnsw.efConstruction = Config.HNSW_CONSTRUCTION_EF
+                self._pending.hnsw.efSearch = Config.HNSW_SEARCH_EF
+                self._pending_start = self._end_label()
+            start = self._pending_start + self._pending.ntotal
+            self._pending.add(vectors)
+        self._docstore.add(range(start, start + len(ids)), ids, texts, metadatas)
+    
+    def _delete(self, ids: List[str]):
+        """Remove chunks from the docstore; searches skip their vectors"""
+        self._docstore.delete(ids)
+    
+    def _search(self, query: np.ndarray, k: int) -> List[Tuple[int, float]]:
+        """Top k (label, similarity) pairs across all segments; hold _index_lock"""
+        hits = []
+        for start, index in self._searchable():
+            if index.ntotal == 0:
+                continue
+            similarities, labels = index.search(query, k)
+            hits.extend(
+                (start + int(label), float(sim))
+                for label, sim in zip(labels[0], similarities[0])
+                if label != -1
+            )
+        hits.sort(key=lambda hit: hit[1], reverse=True)
+        return hits[:k]
+    
+    def _query(self, query_embedding: List[float], k: int) -> List[Tuple[LangchainDocument, float]]:
+        """Nearest chunks to an embedding as (document, cosine distance) pairs"""
+        query = _normalize(query_embedding)[np.newaxis, :]
+        with self._index_lock:
+            hits = self._search(query, k)
+        
+        chunks = self._docstore.get_many([label for label, _ in hits])
+        return [
+            (LangchainDocument(page_content=chunks[label][0], metadata=chunks[label][1]), 1.0 - sim)
+            for label, sim in hits
+            if label in chunks
+        ]
+    
+    def _query_vectors(self, query_embedding: List[float], k: int) -> Tuple[List[LangchainDocument], np.ndarray]:
+        """Nearest chunks to an embedding and their (normalised) stored vectors"""
+        query = _normalize(query_embedding)[np.newaxis, :]
+        with self._index_lock:
+            labels = [label for label, _ in self._search(query, k)]
+            chunks = self._docstore.get_many(labels)
+            labels = [label for label in labels if label in chunks]
+            segments = self._searchable()
+            starts = [start for start, _ in segments]
+            vectors = []
+            for label in labels:
+                start, index = segments[bisect_right(starts, label) - 1]
+                vectors.append(index.reconstruct(label - start))
+        
+        documents = [
+            LangchainDocument(page_content=chunks[label][0], metadata=chunks[label][1])
+            for label in labels
+        ]
+        if not vectors:
+            return documents, np.empty((0, query.shape[1]), dtype=np.float32)
+        return documents, np.vstack(vectors)
+    
+    def _count(self) -> int:
+        """Number of vectors in all segments"""
+        with self._index_lock:
+            return sum(index.ntotal for _, index in self._searchable())
+    
+    def _drop_index(self):
+        """Delete every segment file and stored chunk"""
+        with self._index_lock:
+            # Unmap every segment first; a mapped file cannot be removed on Windows
+            self._segments = []
+            self._pending = None
+            for start in self._saved_segment_starts():
+                os.remove(self._segment_path(start))
+        self._docstore.clear()
+    
+    def _distance_space(self) -> str:
+        """Vectors are normalised, so inner-product search ranks by cosine"""
+        return "cosine"
+    
+    def _persist(self):
+        """Commit stored chunks, save the pending segment and merge small segments"""
+        self._docstore.commit()
+        with self._index_lock:
+            if self._pending is None or self._pending.ntotal == 0:
+                return
+            start = self._pending_start
+            self._write_segment(start, self._pending)
+            self._segments.append((start, self._map_segment(start)))
+            self._pending = None
+            
+            while len(self._segments) >= 2 and self._should_merge():
+                self._merge_segments()
+    
+    def _should_merge(self) -> bool:
+        """Whether the last segment is large enough to fold into the one before it"""
+        (start, older), (next_start, newer) = self._segments[-2:]
+        return (older.ntotal < self.SEGMENT_MERGE_FACTOR * newer.ntotal
+                and next_start == start + older.ntotal)
+    
+    def _merge_segments(self):
+        """Fold the last segment into the one before it; hold _index_lock"""
+        import faiss
+        
+        start, next_start = self._segments[-2][0], self._segments[-1][0]
+        newer = self._segments[-1][1]
+        # Unmap both segments before their files are replaced or removed;
+        # Windows refuses to do either to a file that is still mapped
+        del self._segments[-2:]
+        # The older segment is small relative to the corpus unless the
+        # newer one is comparably large, so loading it is bounded
+        merged = faiss.read_index(self._segment_path(start))
+        merged.add(newer.reconstruct_n(0, newer.ntotal))
+        del newer
+        self._write_segment(start, merged)
+        # A crash before this leaves a covered file that _open_index removes
+        os.remove(self._segment_path(next_start))
+        self._segments.append((start, self._map_segment(start)))
+
+
+def create_vector_store() -> VectorStore:
+    """Vector store for the backend named by Config.VECTOR_BACKEND"""
+    backends = {cls.BACKEND: cls for cls in (ChromaVectorStore, FAISSVectorStore)}
+    if Config.VECTOR_BACKEND not in backends:
+        raise ValueError(f"Unknown vector backend: {Config.VECTOR_BACKEND}")
+    return backends[Config.VECTOR_BACKEND]()
@@ -3,52 +3,41 @@ Test script to verify the RAG PDF Assistant installation
 """
 import sys
 import os
+import importlib
+from concurrent.futures import ThreadPoolExecutor
+
+# (module, display name) for each required package
+PACKAGES = [
+    ("streamlit", "Streamlit"),
+    ("langchain", "LangChain"),
+    ("chromadb", "ChromaDB"),
+    ("openai", "OpenAI"),
+    ("fitz", "PyMuPDF"),
+]
+
+def _import(name):
+    """Import a module, returning any error it raises instead of propagating it"""
+    try:
+        importlib.import_module(name)
+        return None
+    except Exception as e:
+        return e
 
 def test_imports():
     """Test if all required packages can be imported"""
     print("Testing package imports...")
     
-    try:
-        import streamlit
-        print("✓ Streamlit imported successfully")
-    except ImportError as e:
-        print(f"✗ Streamlit import failed: {e}")
-        return False
-    
-    try:
-        import langchain
-        print("✓ LangChain imported successfully")
-    except ImportError as e:
-        print(f"✗ LangChain import failed: {e}")
-        return False
-    
-    try:
-        import chromadb
-        print("✓ ChromaDB imported successfully")
-    except ImportError as e:
-        print(f"✗ ChromaDB import failed: {e}")
-        return False
-    
-    try:
-        import openai
-        print("✓ OpenAI imported successfully")
-    except ImportError as e:
-        print(f"✗ OpenAI import failed: {e}")
-        return False
-    
-    try:
-        import PyPDF2
-        print("✓ PyPDF2 imported successfully")
-    except ImportError as e:
-        print(f"✗ PyPDF2 import failed: {e}")
-        return False
-    
-    try:
-        import fitz
-        print("✓ PyMuPDF imported successfully")
-    except ImportError as e:
-        print(f"✗ PyMuPDF import failed: {e}")
-        return False
+    # Cold imports are mostly disk reads, so they overlap well across threads
+    with ThreadPoolExecutor(max_workers=len(PACKAGES)) as executor:
+        futures = [executor.submit(_import, name) for name, _ in PACKAGES]
+        for (_, label), future in zip(PACKAGES, futures):
+            error = future.result()
+            if error is not None:
+                print(f"✗ {label} import failed: {error}")
+                for pending in futures:
+                    pending.cancel()
+                return False
+            print(f"✓ {label} imported successfully")
     
     return True
 
@@ -86,8 +75,8 @@ def test_components():
         # Only test vector store if API key is available
         from config import Config
         if Config.OPENAI_API_KEY:
-            from vector_store import VectorStore
-            vector_store = VectorStore()
+            from vector_store import create_vector_store
+            vector_store = create_vector_store()
             print("✓ Vector store initialized")
             
             from rag_system import RAGSystem